@@ -1,10 +1,151 @@
 import re
+import hashlib
+import threading
 from typing import Dict, List, Any
-from jinja2 import Template
+from jinja2 import Environment, FileSystemBytecodeCache, FunctionLoader
 from io import TextIOWrapper
 from django.core.exceptions import ObjectDoesNotExist
 from .models import LatexDocument
 
+# Single-pass escape table for special LaTeX characters
+_LATEX_ESCAPE = str.maketrans({
+    '&': r'\&',
+    '%': r'\%',
+    '$': r'\$',
+    '#': r'\#',
+    '_': r'\_',
+    '{': r'\{',
+    '}': r'\}',
+    '~': r'\textasciitilde{}',
+    '^': r'\textasciicircum{}',
+    '\\': r'\textbackslash{}',
+})
+_LATEX_META_RE = re.compile(r'[&%$#_{}~^\\]')
+
+# Last active LatexDocument read from storage
+_active_template_cache = {}
+
+_DEFAULT_TEMPLATE_TEXT = r"""
+\documentclass{llncs}
+
+% PACKAGES
+\usepackage[utf8]{inputenc}
+\usepackage{amsmath,amsfonts,amssymb}
+\usepackage{graphicx}
+\usepackage{cite}
+\usepackage{hyperref}
+\usepackage{url}
+\usepackage{float}
+\usepackage{caption}
+\usepackage{booktabs}
+
+% TITLE
+\title{ {{ title }} }
+
+% AUTHORS BLOCK
+\author{ {{ author_block | safe }} }
+
+\begin{document}
+
+\maketitle
+
+% ABSTRACT
+\begin{abstract}
+{{ abstract }}
+\end{abstract}
+
+% KEYWORDS
+{% if keywords %}
+\keywords{ {{ keywords }} }
+{% endif %}
+
+% MAIN CONTENT
+{{ content | safe }}
+
+% REFERENCES
+\bibliographystyle{splncs04}
+\begin{thebibliography}{99}
+{{ bibliography | safe }}
+\end{thebibliography}
+
+\end{document}
+        """
+
+# Template fields that do not depend on the extracted document
+_STATIC_TEMPLATE_DATA = {
+    "non_technical_summary": "",
+    "acknowledgements": "",
+    "data_availability": "",
+    "competing_interests": "",
+    "methods_content": "",
+    "doi": "",
+    "editor_name": "",
+    "received_date": "",
+    "accepted_date": "",
+    "published_date": "",
+    "year": "2025",
+    "volume": "1",
+    "paper_number": "001",
+    "bib_file": "references.bib"
+}
+
+# Fixed LaTeX blocks filled in with str.format_map
+_FIGURE_TEMPLATE = (
+    "\\begin{{figure}}[H]\n"
+    "\\centering\n"
+    "\\includegraphics[width=0.8\\textwidth]{{{path}}}\n"
+    "\\caption{{{caption}}}\n"
+    "\\label{{{label}}}\n"
+    "\\end{{figure}}"
+)
+_LIST_TEMPLATE = "\\begin{{itemize}}\n{items}\n\\end{{itemize}}"
+_TABLE_TEMPLATE = (
+    "\\begin{{table}}[H]\n"
+    "\\centering\n"
+    "\\caption{{{caption}}}\n"
+    "\\label{{tab:{label_lower}}}\n"
+    "\\begin{{tabular}}{{|{col_format}|}}\n"
+    "\\hline\n"
+    "{header} \\\\\n"
+    "\\hline\n"
+    "{rows}\n"
+    "\\hline\n"
+    "\\end{{tabular}}\n"
+    "\\end{{table}}"
+)
+
+# Template sources registered by content hash while Jinja loads them;
+# bytecode caching only applies to loader-backed templates, not
+# Environment.from_string
+_template_sources = {}
+_template_lock = threading.Lock()
+
+def _make_bytecode_cache():
+    # The default cache directory lives under the system temp dir; render
+    # without it rather than fail the import when it is unusable
+    try:
+        return FileSystemBytecodeCache()
+    except (OSError, RuntimeError):
+        return None
+
+_JINJA_ENV = Environment(
+    loader=FunctionLoader(_template_sources.get),
+    bytecode_cache=_make_bytecode_cache(),
+    auto_reload=False,
+    cache_size=64,
+)
+
+def _compile_template(template_text):
+    # The environment caches compiled templates by name, so the source is
+    # only needed while it is being loaded
+    name = hashlib.sha1(template_text.encode('utf-8')).hexdigest()
+    with _template_lock:
+        _template_sources[name] = template_text
+        try:
+            return _JINJA_ENV.get_template(name)
+        finally:
+            del _template_sources[name]
+
 class LatexConverter:
     def __init__(self, template_key, template_content=None):
         self.template_key = template_key
@@ -12,7 +153,7 @@ class LatexConverter:
 
     def convert(self, extracted_data: dict) -> str:
         filled_data = self.prepare_template_data(extracted_data)
-        template = Template(self.template_text)
+        template = _compile_template(self.template_text)
         return template.render(**filled_data)
 
     def prepare_template_data(self, data: dict) -> dict:
@@ -21,29 +162,17 @@ class LatexConverter:
         references = data.get("references", [])
         tables = data.get("tables", [])
 
+        title = metadata.get("title", "Untitled")
         return {
-            "title": metadata.get("title", "Untitled"),
-            "short_title": metadata.get("title", "Untitled")[:30],
+            **_STATIC_TEMPLATE_DATA,
+            "title": title,
+            "short_title": title[:30],
             "abstract": metadata.get("abstract", ""),
             "keywords": ', '.join(metadata.get("keywords", [])),
             "author_block": self.format_authors(metadata.get("authors", [])),
             "credit_roles": self.format_roles(metadata.get("authors", [])),
             "content": self.format_body(body),
             "bibliography": self.format_references(references),
-            "non_technical_summary": "",
-            "acknowledgements": "",
-            "data_availability": "",
-            "competing_interests": "",
-            "methods_content": "",
-            "doi": "",
-            "editor_name": "",
-            "received_date": "",
-            "accepted_date": "",
-            "published_date": "",
-            "year": "2025",
-            "volume": "1",
-            "paper_number": "001",
-            "bib_file": "references.bib"
         }
 
     def format_authors(self, authors):
@@ -68,142 +197,100 @@ class LatexConverter:
         return '\\\\'.join(roles)
 
     def format_body(self, body_sections):
-        latex = []
+        out = []
+        self._emit_body(body_sections, out)
+        return ''.join(out)
+
+    def _emit_body(self, body_sections, out):
         for section in body_sections:
             if section.get("type") == "section":
-                latex.append(f"\\section{{{section.get('heading','')}}}")
+                if out:
+                    out.append('\n\n')
+                out.append(f"\\section{{{section.get('heading','')}}}")
                 for item in section.get("content", []):
-                    latex.append(self.format_content_item(item))
-        return '\n\n'.join(latex)
+                    out.append('\n\n')
+                    self._emit_content_item(item, out)
 
     def format_content_item(self, item):
+        out = []
+        self._emit_content_item(item, out)
+        return ''.join(out)
+
+    def _emit_content_item(self, item, out):
         if item.get("type") == "paragraph":
-            return self.clean_latex_text(item.get("text", ""))
+            out.append(self.clean_latex_text(item.get("text", "")))
         elif item.get("type") == "figure":
-            return self.format_figure(item)
+            out.append(self.format_figure(item))
         elif item.get("type") == "list":
-            return self.format_list(item)
+            out.append(self.format_list(item))
         elif item.get("type") == "table":
-            return self.format_table(item)
+            out.append(self.format_table(item))
         elif item.get("type") == "subsection":
-            return f"\\subsection{{{item.get('heading','')}}}\n\n" + \
-                   '\n\n'.join([self.format_content_item(subitem) for subitem in item.get("content", [])])
-        return ""
+            out.append(f"\\subsection{{{item.get('heading','')}}}\n\n")
+            for idx, subitem in enumerate(item.get("content", [])):
+                if idx:
+                    out.append('\n\n')
+                self._emit_content_item(subitem, out)
 
     def clean_latex_text(self, text):
         # Escape special LaTeX characters
-        text = text.replace('&', '\\&')
-        text = text.replace('%', '\\%')
-        text = text.replace('$', '\\$')
-        text = text.replace('#', '\\#')
-        text = text.replace('_', '\\_')
-        text = text.replace('{', '\\{')
-        text = text.replace('}', '\\}')
-        text = text.replace('~', '\\textasciitilde')
-        text = text.replace('^', '\\textasciicircum')
-        text = text.replace('\\', '\\textbackslash')
-        return text
+        if _LATEX_META_RE.search(text) is None:
+            return text
+        return text.translate(_LATEX_ESCAPE)
 
     def format_figure(self, figure):
-        caption = self.clean_latex_text(figure.get("caption", ""))
-        label = figure.get("label", "").replace(" ", "")
-        path = figure.get("content", "").replace("\\", "/")  # Fix path separators
-        
-        return (
-            "\\begin{figure}[H]\n"
-            "\\centering\n"
-            f"\\includegraphics[width=0.8\\textwidth]{{{path}}}\n"
-            f"\\caption{{{caption}}}\n"
-            f"\\label{{{label}}}\n"
-            "\\end{figure}"
-        )
+        return _FIGURE_TEMPLATE.format_map({
+            "caption": self.clean_latex_text(figure.get("caption", "")),
+            "label": figure.get("label", "").replace(" ", ""),
+            "path": figure.get("content", ""),
+        })
 
     def format_list(self, item):
         items = '\n'.join([f"  \\item {self.clean_latex_text(i)}" for i in item.get("items",[])])
-        return "\\begin{itemize}\n" + items + "\n\\end{itemize}"
+        return _LIST_TEMPLATE.format_map({"items": items})
 
     def format_table(self, table):
         headers = [self.clean_latex_text(h) for h in table.get("header", [])]
-        rows = [[self.clean_latex_text(cell) for cell in row] for row in table.get("rows", [])]
-        col_format = " | ".join(["l"] * len(headers))
-        latex_rows = [' & '.join(row) + " \\\\" for row in rows]
-        
-        return (
-            "\\begin{table}[H]\n\\centering\n"
-            f"\\caption{{{table.get('label','')}}}\n"
-            f"\\label{{tab:{table.get('label','').lower()}}}\n"
-            f"\\begin{{tabular}}{{|{col_format}|}}\n\\hline\n"
-            + ' & '.join(headers) + " \\\\\n\\hline\n"
-            + '\n'.join(latex_rows) + "\n\\hline\n"
-            "\\end{tabular}\n\\end{table}"
-        )
+        label = table.get('label', '')
+        return _TABLE_TEMPLATE.format_map({
+            "caption": label,
+            "label_lower": label.lower(),
+            "col_format": " | ".join(["l"] * len(headers)),
+            "header": ' & '.join(headers),
+            "rows": '\n'.join([
+                ' & '.join([self.clean_latex_text(cell) for cell in row]) + " \\\\"
+                for row in table.get("rows", [])
+            ]),
+        })
 
     def format_references(self, refs):
         if not refs:
             return ""
-        # Remove duplicates by citation text
-        unique_refs = []
-        seen = set()
+        # Remove duplicates by citation text, keeping the first occurrence
+        unique_refs = {}
         for r in refs:
-            citation = r['citation']
-            if citation not in seen:
-                seen.add(citation)
-                unique_refs.append(r)
-        return '\n'.join([f"\\bibitem{{ref{r['id']}}} {self.clean_latex_text(r['citation'])}" for r in unique_refs])
+            unique_refs.setdefault(r['citation'], r)
+        return '\n'.join([f"\\bibitem{{ref{r['id']}}} {self.clean_latex_text(citation)}" for citation, r in unique_refs.items()])
 
     def default_template(self):
-        return r"""
-\documentclass{llncs}
+        return _DEFAULT_TEMPLATE_TEXT
 
-% PACKAGES
-\usepackage[utf8]{inputenc}
-\usepackage{amsmath,amsfonts,amssymb}
-\usepackage{graphicx}
-\usepackage{cite}
-\usepackage{hyperref}
-\usepackage{url}
-\usepackage{float}
-\usepackage{caption}
-\usepackage{booktabs}
-
-% TITLE
-\title{ {{ title }} }
-
-% AUTHORS BLOCK
-\author{ {{ author_block | safe }} }
-
-\begin{document}
-
-\maketitle
-
-% ABSTRACT
-\begin{abstract}
-{{ abstract }}
-\end{abstract}
-
-% KEYWORDS
-{% if keywords %}
-\keywords{ {{ keywords }} }
-{% endif %}
-
-% MAIN CONTENT
-{{ content | safe }}
-
-% REFERENCES
-\bibliographystyle{splncs04}
-\begin{thebibliography}{99}
-{{ bibliography | safe }}
-\end{thebibliography}
-
-\end{document}
-        """
+def _read_active_template(active_template):
+    # Re-read the uploaded .tex file only when a different one becomes active
+    cache_key = (active_template.pk, active_template.tex_file.name)
+    template_content = _active_template_cache.get(cache_key)
+    if template_content is None:
+        f = active_template.tex_file.open()
+        with TextIOWrapper(f, encoding='utf-8') as text_file:
+            template_content = text_file.read()
+        _active_template_cache.clear()
+        _active_template_cache[cache_key] = template_content
+    return template_content
 
 def text_to_latex(extracted_data: dict) -> str:
     try:
         active_template = LatexDocument.objects.get(is_active=True)
-        f = active_template.tex_file.open()
-        with TextIOWrapper(f, encoding='utf-8') as text_file:
-            template_content = text_file.read()
+        template_content = _read_active_template(active_template)
     except LatexDocument.DoesNotExist:
         template_content = None
 
@@ -1,16 +1,41 @@
-import os
 import re
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
+from pathlib import Path
 from PIL import Image
 from docx import Document
 from docx.opc.constants import RELATIONSHIP_TYPE as RT
 import fitz
-import pdfplumber
+
+_EMAIL_RE = re.compile(r'[\w\.-]+@[\w\.-]+\.\w+')
+_EMAIL_TOKEN_RE = re.compile(r'(\S+@\S+)')
+_HEADING_LEVEL_RE = re.compile(r'heading\s*(\d+)')
+_ABSTRACT_RE = re.compile(r'abstract', re.I)
+_KEYWORDS_RE = re.compile(r'(keywords|key terms|index terms)\s*[:.]?', re.I)
+_FIG_RE = re.compile(r'(?:figure|fig)[\s\.]*(\d+)[\s:\.-]+(.*)', re.I)
+_FIG_PREFIX_RE = re.compile(r'fig\s*\d*\s*:', re.I)
+_PARACTICE_RE = re.compile(r'paractice', re.I)
+_BULLET_RE = re.compile(r'^[\u2022•\-]\s*')
+_REF_RE = re.compile(r'references?', re.I)
+_SPLIT_KW_RE = re.compile(r'[,;]')
+_SANITIZE_RE = re.compile(r'[^\w\-_. ]')
+
+# Pillow releases the GIL while encoding, so figure saves run off the parsing loop
+_IMAGE_POOL = ThreadPoolExecutor(max_workers=4)
+
+# Formats that can be written straight from the DOCX blob without re-encoding
+_RAW_IMAGE_TYPES = {
+    'image/png': 'png',
+    'image/jpeg': 'jpeg',
+    'image/gif': 'gif',
+    'image/webp': 'webp',
+}
+
+_MEDIA_DIR = Path("extracted_images")
 
 def extract_docx(filepath):
     doc = Document(filepath)
-    media_dir = "extracted_images"
-    os.makedirs(media_dir, exist_ok=True)
+    _MEDIA_DIR.mkdir(parents=True, exist_ok=True)
 
     content = {
         "metadata": {
@@ -25,59 +50,54 @@ def extract_docx(filepath):
         "tables": []
     }
 
-    def is_heading(para):
-        return para.style.name.lower().startswith('heading')
+    def is_heading(style):
+        return style.startswith('heading')
 
-    def get_heading_level(para):
-        match = re.match(r'heading\s*(\d+)', para.style.name.lower())
+    def get_heading_level(style):
+        match = _HEADING_LEVEL_RE.match(style)
         return int(match.group(1)) if match else 1
 
     def clean_text(text):
-        text = re.sub(r'\s+', ' ', text)
-        return text.strip()
+        return ' '.join(text.split())
 
     def save_image(image_part, index, caption=None):
         try:
             data = image_part.blob
-            img = Image.open(BytesIO(data))
-            ext = img.format.lower() if img.format else 'png'
-            filename = f"figure_{index}.{ext}"
-            path = os.path.join(media_dir, filename)
-            img.save(path)
+            ext = _RAW_IMAGE_TYPES.get(image_part.content_type)
+            if ext:
+                filename = f"figure_{index}.{ext}"
+                path = _MEDIA_DIR / filename
+                future = _IMAGE_POOL.submit(path.write_bytes, data)
+            else:
+                # EMF/WMF/BMP and friends still go through Pillow
+                img = Image.open(BytesIO(data))
+                ext = img.format.lower() if img.format else 'png'
+                filename = f"figure_{index}.{ext}"
+                path = _MEDIA_DIR / filename
+                future = _IMAGE_POOL.submit(img.save, path)
             return {
                 "id": f"fig_{index}",
                 "filename": filename,
                 "caption": caption or f"Figure {index}",
-                "path": path
-            }
+                "path": path.as_posix()
+            }, future
         except Exception as e:
             print(f"Error saving image: {e}")
-            return None
-
-    paras = list(doc.paragraphs)
-    i = 0
-    while i < len(paras) and not paras[i].text.strip():
-        i += 1
-    if i < len(paras):
-        content["metadata"]["title"] = clean_text(paras[i].text)
-        i += 1
-
-    author_block = []
-    while i < len(paras):
-        text = clean_text(paras[i].text)
-        if not text:
-            i += 1
-            continue
-        if re.match(r'abstract', text, re.I) or is_heading(paras[i]):
-            break
-        author_block.append(text)
-        i += 1
+            return None, None
 
-    for author_line in author_block:
-        email_match = re.search(r'[\w\.-]+@[\w\.-]+\.\w+', author_line)
+    def iter_paragraphs():
+        # python-docx resolves styles and text through the XML tree on every
+        # access, so read each non-empty paragraph's style and text only once
+        for idx, para in enumerate(doc.paragraphs):
+            text = clean_text(para.text)
+            if text:
+                yield idx, para.style.name.lower(), text
+
+    def add_author(author_line):
+        email_match = _EMAIL_RE.search(author_line)
         email = email_match.group(0) if email_match else ""
-        author_clean = re.sub(r'[\w\.-]+@[\w\.-]+\.\w+', '', author_line).strip()
-        parts = [p.strip() for p in re.split(r',|;', author_clean)]
+        author_clean = _EMAIL_RE.sub('', author_line).strip()
+        parts = [p.strip() for p in _SPLIT_KW_RE.split(author_clean)]
         if len(parts) >= 2:
             name = parts[0]
             role = parts[1] if len(parts) > 2 else ""
@@ -93,67 +113,92 @@ def extract_docx(filepath):
             "email": email
         })
 
+    pending_saves = []
+    image_rels = [rel for rel in doc.part.rels.values() if rel.reltype == RT.IMAGE]
+
+    # Document phase: title -> authors -> front (abstract/keywords) -> body
+    phase = "title"
     in_abstract = False
     in_keywords = False
     abstract_lines = []
     keywords = []
 
-    while i < len(paras):
-        text = clean_text(paras[i].text)
-        if not text:
-            i += 1
-            continue
-
-        if re.match(r'abstract', text, re.I):
-            in_abstract = True
-            i += 1
-            continue
-
-        if in_abstract and re.match(r'(keywords|key terms|index terms)\s*[:.]?', text, re.I):
-            content["metadata"]["abstract"] = ' '.join(abstract_lines)
-            in_abstract = False
-            in_keywords = True
-            i += 1
-            continue
-
-        if in_abstract:
-            if is_heading(paras[i]):
-                content["metadata"]["abstract"] = ' '.join(abstract_lines)
-                in_abstract = False
-            else:
-                abstract_lines.append(text)
-                i += 1
-            continue
-
-        if in_keywords:
-            if is_heading(paras[i]):
-                in_keywords = False
-            else:
-                for kw in re.split(r'[,;]', text):
-                    kw = kw.strip()
-                    if kw:
-                        keywords.append(kw)
-                i += 1
-            continue
-
-        break
-
-    if keywords:
-        content["metadata"]["keywords"] = keywords
-
     current_section = None
     current_subsection = None
+    current_list = None
     fig_count = 1
+    rel_index = 0
+
+    # References are gathered alongside the phases: everything after the
+    # first "References" paragraph up to the next heading
+    ref_phase = "seeking"
+    refs = None
+
+    for idx, style, text in iter_paragraphs():
+        if ref_phase == "seeking":
+            if _REF_RE.match(text):
+                if idx:
+                    refs = []
+                    ref_phase = "collecting"
+                else:
+                    ref_phase = "done"
+        elif ref_phase == "collecting":
+            if is_heading(style):
+                ref_phase = "done"
+            else:
+                refs.append({
+                    "id": f"{len(refs) + 1}",
+                    "citation": text
+                })
 
-    while i < len(paras):
-        para = paras[i]
-        text = clean_text(para.text)
-        if not text:
-            i += 1
+        if phase == "title":
+            content["metadata"]["title"] = text
+            phase = "authors"
             continue
 
-        if is_heading(para):
-            level = get_heading_level(para)
+        if phase == "authors":
+            if not (_ABSTRACT_RE.match(text) or is_heading(style)):
+                add_author(text)
+                continue
+            phase = "front"
+
+        if phase == "front":
+            # A heading that closes the abstract or keywords is looked at
+            # again, so the loop below only exits once the paragraph is used
+            consumed = False
+            while not consumed:
+                if _ABSTRACT_RE.match(text):
+                    in_abstract = True
+                    consumed = True
+                elif in_abstract and _KEYWORDS_RE.match(text):
+                    content["metadata"]["abstract"] = ' '.join(abstract_lines)
+                    in_abstract = False
+                    in_keywords = True
+                    consumed = True
+                elif in_abstract:
+                    if is_heading(style):
+                        content["metadata"]["abstract"] = ' '.join(abstract_lines)
+                        in_abstract = False
+                    else:
+                        abstract_lines.append(text)
+                        consumed = True
+                elif in_keywords:
+                    if is_heading(style):
+                        in_keywords = False
+                    else:
+                        for kw in _SPLIT_KW_RE.split(text):
+                            kw = kw.strip()
+                            if kw:
+                                keywords.append(kw)
+                        consumed = True
+                else:
+                    phase = "body"
+                    break
+            if consumed:
+                continue
+
+        if is_heading(style):
+            level = get_heading_level(style)
             if level == 1:
                 if current_section:
                     content["body"].append(current_section)
@@ -163,6 +208,7 @@ def extract_docx(filepath):
                     "content": []
                 }
                 current_subsection = None
+                current_list = None
             elif level == 2:
                 if current_section:
                     current_subsection = {
@@ -182,18 +228,18 @@ def extract_docx(filepath):
                         }]
                     }
                     current_subsection = current_section["content"][0]
-            i += 1
+                current_list = None
             continue
 
-        fig_match = re.match(r'(?:figure|fig)[\s\.]*(\d+)[\s:\.-]+(.*)', text, re.I)
+        fig_match = _FIG_RE.match(text)
         if fig_match:
             fig_num = fig_match.group(1)
             caption = fig_match.group(2).strip()
             image_info = None
-            for rel in doc.part.rels.values():
-                if rel.reltype == RT.IMAGE:
-                    image_info = save_image(rel.target_part, fig_count, f"Figure {fig_num}: {caption}")
-                    break
+            if rel_index < len(image_rels):
+                # Advance past unreadable images so later captions can still match
+                image_info, future = save_image(image_rels[rel_index].target_part, fig_count, f"Figure {fig_num}: {caption}")
+                rel_index += 1
             if image_info:
                 content["metadata"]["figures"].append(image_info)
                 fig_count += 1
@@ -203,12 +249,17 @@ def extract_docx(filepath):
                     "caption": caption,
                     "content": image_info["path"]
                 }
+                fig_target = None
                 if current_subsection:
-                    current_subsection["content"].append(fig_item)
+                    fig_target = current_subsection["content"]
                 elif current_section:
-                    current_section["content"].append(fig_item)
-            i += 1
-            continue
+                    fig_target = current_section["content"]
+                if fig_target is not None:
+                    fig_target.append(fig_item)
+                pending_saves.append((future, image_info, fig_item, fig_target, text))
+                current_list = None
+                continue
+            # No image left for this caption; keep its text in the body
 
         if current_subsection:
             container = current_subsection
@@ -222,25 +273,42 @@ def extract_docx(filepath):
             }
             container = current_section
 
-        if para.style.name.lower().startswith('list') or text.startswith(('•', '-', '*')):
-            list_item = {
-                "type": "list",
-                "items": [text.lstrip('•-* ').strip()]
-            }
-            if container["content"] and container["content"][-1].get("type") == "list":
-                container["content"][-1]["items"].append(text.lstrip('•-* ').strip())
+        if style.startswith('list') or text.startswith(('•', '-', '*')):
+            item_text = text.lstrip('•-* ').strip()
+            if current_list is not None:
+                current_list["items"].append(item_text)
             else:
-                container["content"].append(list_item)
+                current_list = {
+                    "type": "list",
+                    "items": [item_text]
+                }
+                container["content"].append(current_list)
         else:
             container["content"].append({
                 "type": "paragraph",
                 "text": text
             })
-        i += 1
+            current_list = None
+
+    if keywords:
+        content["metadata"]["keywords"] = keywords
 
     if current_section:
         content["body"].append(current_section)
 
+    for future, image_info, fig_item, fig_target, fig_text in pending_saves:
+        try:
+            future.result()
+        except Exception as e:
+            # Drop figures whose image never reached disk, keeping the caption text
+            print(f"Error saving image: {e}")
+            content["metadata"]["figures"].remove(image_info)
+            if fig_target is not None:
+                fig_target[:] = [
+                    {"type": "paragraph", "text": fig_text} if item is fig_item else item
+                    for item in fig_target
+                ]
+
     table_count = 1
     for table in doc.tables:
         table_data = {
@@ -249,11 +317,11 @@ def extract_docx(filepath):
             "header": [],
             "rows": []
         }
-        if table.rows:
-            header_row = table.rows[0]
-            table_data["header"] = [clean_text(cell.text) for cell in header_row.cells]
-            for row in table.rows[1:]:
-                table_data["rows"].append([clean_text(cell.text) for cell in row.cells])
+        # Walk the table XML once and clean every cell in one pass
+        cells = [[clean_text(cell.text) for cell in row.cells] for row in table.rows]
+        if cells:
+            table_data["header"] = cells[0]
+            table_data["rows"] = cells[1:]
             content["tables"].append(table_data)
             if content["body"]:
                 content["body"][-1]["content"].append(table_data)
@@ -265,33 +333,14 @@ def extract_docx(filepath):
                 })
             table_count += 1
 
-    ref_section = None
-    for j, para in enumerate(paras):
-        if re.match(r'references?', clean_text(para.text), re.I):
-            ref_section = j
-            break
-    if ref_section:
-        refs = []
-        ref_id = 1
-        for para in paras[ref_section+1:]:
-            text = clean_text(para.text)
-            if not text:
-                continue
-            if is_heading(para):
-                break
-            refs.append({
-                "id": f"{ref_id}",
-                "citation": text
-            })
-            ref_id += 1
+    if refs is not None:
         content["references"] = refs
 
     return content
 
 def extract_pdf(filepath):
     doc = fitz.open(filepath)
-    media_dir = "extracted_images"
-    os.makedirs(media_dir, exist_ok=True)
+    _MEDIA_DIR.mkdir(parents=True, exist_ok=True)
 
     output = []
     figures = []
@@ -299,114 +348,103 @@ def extract_pdf(filepath):
     references = []
 
     def sanitize_filename(text):
-        match = re.match(r'fig\s*\d*\s*:\s*(.+)', text, re.I)
-        if match:
-            caption_text = match.group(1)
-        else:
-            caption_text = text
-        caption_text = caption_text.lower().strip()
-        caption_text = re.sub(r'[^\w\-_. ]', '', caption_text)
-        caption_text = caption_text.replace(' ', '_')
-        return caption_text if caption_text else 'image'
-
-    with pdfplumber.open(filepath) as pdf_plumber:
-        for page_num, page in enumerate(doc, start=1):
-            blocks = page.get_text("blocks")
-            blocks.sort(key=lambda b: b[1])
-            pdf_page = pdf_plumber.pages[page_num - 1]
-            table_bboxes = []
-            for t in pdf_page.find_tables():
-                bbox = t.bbox
-                table_bboxes.append((bbox, t))
-            combined = []
-            for bbox, tbl in table_bboxes:
-                combined.append(('table', bbox[1], tbl))
-            for b in blocks:
-                combined.append(('text', b[1], b))
-            combined.sort(key=lambda x: x[1])
-            tables_output = set()
-            images_info = []
-            for img_index, img in enumerate(page.get_images(full=True)):
-                xref = img[0]
-                base_image = doc.extract_image(xref)
-                img_bytes = base_image["image"]
-                ext = base_image["ext"]
-                images_info.append({"xref": xref, "bytes": img_bytes, "ext": ext})
-            image_used = [False] * len(images_info)
-            for item_type, y, content in combined:
-                if item_type == 'table':
-                    if content not in tables_output:
-                        tables_output.add(content)
-                        try:
-                            table_data = content.extract()
-                        except Exception:
-                            table_data = content.extract_table()
-                        if not table_data:
-                            table_data = []
-                        if table_data:
-                            tables.append({
-                                "type": "table",
-                                "label": f"Table{len(tables)+1}",
-                                "header": table_data[0],
-                                "rows": table_data[1:]
-                            })
-                elif item_type == 'text':
-                    x0, y0, x1, y1, text, block_no, block_type = content
-                    if block_type == 0:
-                        text = text.strip()
-                        skip_line = False
-                        for bbox, tbl in table_bboxes:
-                            if y0 >= bbox[1] and y1 <= bbox[3]:
-                                skip_line = True
+        # Only called for "Fig N:" captions, so the caption is the first
+        # line after the first colon
+        caption_text = text.split(':', 1)[1].lstrip().split('\n', 1)[0] or text
+        caption_text = _SANITIZE_RE.sub('', caption_text.lower().strip()).replace(' ', '_')
+        return caption_text or 'image'
+
+    for page_num, page in enumerate(doc, start=1):
+        blocks = page.get_text("blocks")
+        blocks.sort(key=lambda b: b[1])
+        table_bboxes = []
+        for t in page.find_tables():
+            bbox = t.bbox
+            table_bboxes.append((bbox, t))
+        combined = []
+        for bbox, tbl in table_bboxes:
+            combined.append(('table', bbox[1], tbl))
+        for b in blocks:
+            combined.append(('text', b[1], b))
+        combined.sort(key=lambda x: x[1])
+        tables_output = set()
+        images_info = []
+        for img_index, img in enumerate(page.get_images(full=True)):
+            xref = img[0]
+            base_image = doc.extract_image(xref)
+            img_bytes = base_image["image"]
+            ext = base_image["ext"]
+            images_info.append({"xref": xref, "bytes": img_bytes, "ext": ext})
+        image_used = [False] * len(images_info)
+        for item_type, y, content in combined:
+            if item_type == 'table':
+                if content not in tables_output:
+                    tables_output.add(content)
+                    try:
+                        table_data = content.extract()
+                    except Exception:
+                        table_data = []
+                    if table_data:
+                        tables.append({
+                            "type": "table",
+                            "label": f"Table{len(tables)+1}",
+                            "header": table_data[0],
+                            "rows": table_data[1:]
+                        })
+            elif item_type == 'text':
+                x0, y0, x1, y1, text, block_no, block_type = content
+                if block_type == 0:
+                    text = text.strip()
+                    skip_line = False
+                    for bbox, tbl in table_bboxes:
+                        if y0 >= bbox[1] and y1 <= bbox[3]:
+                            skip_line = True
+                            break
+                    if skip_line or not text:
+                        continue
+                    email_match = _EMAIL_TOKEN_RE.search(text)
+                    if email_match and not text.startswith("Email:"):
+                        before_email = text[:email_match.start()].strip()
+                        email = email_match.group(1)
+                        after_email = text[email_match.end():].strip()
+                        if before_email:
+                            output.append(before_email)
+                        output.append(email)
+                        if after_email:
+                            output.append(after_email)
+                        continue
+                    text = _BULLET_RE.sub('- ', text)
+                    if _FIG_PREFIX_RE.match(text):
+                        text = _PARACTICE_RE.sub('practice', text)
+                        for idx, used in enumerate(image_used):
+                            if not used:
+                                filename_base = sanitize_filename(text)
+                                filename = f"{filename_base}.{images_info[idx]['ext']}"
+                                filepath_img = _MEDIA_DIR / filename
+                                filepath_img.write_bytes(images_info[idx]["bytes"])
+                                image_used[idx] = True
+                                figures.append({
+                                    "type": "figure",
+                                    "label": f"Fig{len(figures)+1}",
+                                    "caption": text,
+                                    "content": filepath_img.as_posix()
+                                })
                                 break
-                        if skip_line or not text:
-                            continue
-                        email_match = re.search(r'(\S+@\S+)', text)
-                        if email_match and not text.startswith("Email:"):
-                            before_email = text[:email_match.start()].strip()
-                            email = email_match.group(1)
-                            after_email = text[email_match.end():].strip()
-                            if before_email:
-                                output.append(before_email)
-                            output.append(email)
-                            if after_email:
-                                output.append(after_email)
-                            continue
-                        text = re.sub(r'^[\u2022•\-]\s*', '- ', text)
-                        if re.match(r'fig\s*\d*\s*:', text, re.I):
-                            text = re.sub(r'paractice', 'practice', text, flags=re.I)
-                        if re.match(r'fig\s*\d*\s*:', text, re.I):
-                            for idx, used in enumerate(image_used):
-                                if not used:
-                                    filename_base = sanitize_filename(text)
-                                    filename = f"{filename_base}.{images_info[idx]['ext']}"
-                                    filepath_img = os.path.join(media_dir, filename)
-                                    with open(filepath_img, "wb") as f:
-                                        f.write(images_info[idx]["bytes"])
-                                    image_used[idx] = True
-                                    figures.append({
-                                        "type": "figure",
-                                        "label": f"Fig{len(figures)+1}",
-                                        "caption": text,
-                                        "content": filepath_img
-                                    })
-                                    break
-                            else:
-                                output.append(text)
                         else:
                             output.append(text)
-            for idx, used in enumerate(image_used):
-                if not used:
-                    filename = f"image_{page_num}_{idx + 1}.{images_info[idx]['ext']}"
-                    filepath_img = os.path.join(media_dir, filename)
-                    with open(filepath_img, "wb") as f:
-                        f.write(images_info[idx]["bytes"])
-                    figures.append({
-                        "type": "figure",
-                        "label": f"Fig{len(figures)+1}",
-                        "caption": filename,
-                        "content": filepath_img
-                    })
+                    else:
+                        output.append(text)
+        for idx, used in enumerate(image_used):
+            if not used:
+                filename = f"image_{page_num}_{idx + 1}.{images_info[idx]['ext']}"
+                filepath_img = _MEDIA_DIR / filename
+                filepath_img.write_bytes(images_info[idx]["bytes"])
+                figures.append({
+                    "type": "figure",
+                    "label": f"Fig{len(figures)+1}",
+                    "caption": filename,
+                    "content": filepath_img.as_posix()
+                })
 
     cleaned_output = []
     prev_empty = False